@@ -49,3 +49,6 @@ echo ""
 echo "Test:"
 echo "  echo 'Hello, this is a test.' | $INSTALL_DIR/piper/piper --model $VOICES_DIR/${VOICE}.onnx --output_file /tmp/test.wav"
 echo "  afplay /tmp/test.wav"
+echo ""
+echo "Optional — int8 model for ~2x faster CPU synthesis (picked up automatically):"
+echo "  cd server && uv run --with onnx python ../scripts/quantize_piper.py $VOICES_DIR/${VOICE}.onnx"
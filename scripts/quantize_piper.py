@@ -0,0 +1,58 @@
+"""Quantize a Piper voice model for faster CPU inference.
+
+Writes <voice>.int8.onnx (dynamic int8 weights) next to the original model,
+plus a copy of its .onnx.json config. config.py picks the int8 model up
+automatically when it exists.
+
+Usage:
+    uv run --with onnx python ../scripts/quantize_piper.py [model.onnx]
+    uv run --with onnx --with onnxconverter-common python ../scripts/quantize_piper.py --fp16 [model.onnx]
+
+Use --fp16 instead if int8 audio sounds noticeably worse on your voice.
+"""
+
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+DEFAULT_MODEL = Path.home() / ".local/share/piper/voices/en_US-amy-medium.onnx"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("model", nargs="?", type=Path, default=DEFAULT_MODEL)
+    parser.add_argument("--fp16", action="store_true", help="convert to float16 instead of int8")
+    args = parser.parse_args()
+
+    src: Path = args.model
+    if not src.is_file():
+        print(f"❌  Piper model not found: {src}")
+        sys.exit(1)
+
+    precision = "fp16" if args.fp16 else "int8"
+    dst = src.with_suffix(f".{precision}.onnx")
+    print(f"📦 Converting {src.name} → {dst.name}...")
+
+    if args.fp16:
+        import onnx
+        from onnxconverter_common import float16
+
+        model = float16.convert_float_to_float16(onnx.load(str(src)), keep_io_types=True)
+        onnx.save(model, str(dst))
+    else:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(src), str(dst), weight_type=QuantType.QInt8)
+
+    # PiperVoice reads its config from <model>.json
+    shutil.copyfile(f"{src}.json", f"{dst}.json")
+
+    src_mb, dst_mb = src.stat().st_size / 1e6, dst.stat().st_size / 1e6
+    print(f"✅ {dst} ({src_mb:.0f}MB → {dst_mb:.0f}MB)")
+    if args.fp16:
+        print(f"   Set PIPER_MODEL={dst} in server/.env to use it.")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ Run with: uv run bot.py
 Then open http://localhost:7860/client in your browser.
 """
 
+import asyncio
 import os
 import sys
 
@@ -21,9 +22,11 @@ print("⏳ Loading models...\n")
 logger.info("Loading Silero VAD model...")
 from pipecat.audio.vad.silero import SileroVADAnalyzer
 
-logger.info("Silero VAD loaded")
+# Silero keeps per-stream RNN state, so each pipeline needs its own analyzer.
+# Build the first one now so the first connection doesn't pay the model load.
+_preloaded_vad: SileroVADAnalyzer | None = SileroVADAnalyzer()
 
-import time
+logger.info("Silero VAD loaded")
 
 from pipecat.frames.frames import (
     LLMFullResponseEndFrame,
@@ -33,6 +36,7 @@ from pipecat.frames.frames import (
     TTSStartedFrame,
     TTSStoppedFrame,
 )
+from pipecat.observers.base_observer import BaseObserver, FramePushed
 from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
@@ -47,7 +51,8 @@ from pipecat.runner.utils import create_transport
 from pipecat.services.anthropic.llm import AnthropicLLMService
 from pipecat.transports.base_transport import BaseTransport, TransportParams
 
-# Local STT + TTS
+# Local STT + TTS + conversation memory
+from memory import ContextWindow
 from stt_whisper import WhisperSTTProcessor
 from pipecat.services.kokoro.tts import KokoroTTSService
 
@@ -56,39 +61,71 @@ logger.info("All components loaded")
 import config  # Validates config on import
 
 
-class PipelineLogger(FrameProcessor):
-    """Logs key frames as they flow through the pipeline for observability."""
+class PipelineLogger(BaseObserver):
+    """Logs key frames as they leave the STT, LLM and TTS stages.
 
-    def __init__(self, name: str):
+    Runs as a PipelineTask observer rather than a pipeline stage, so TTS
+    audio doesn't pay an extra processor hop on its way to the transport.
+    """
+
+    def __init__(self, name: str, stt: FrameProcessor, llm: FrameProcessor, tts: FrameProcessor):
         super().__init__()
         self._name = name
-        self._llm_start: float = 0
-        self._tts_start: float = 0
-
-    async def process_frame(self, frame, direction):
-        await super().process_frame(frame, direction)
-
-        if isinstance(frame, TranscriptionFrame):
-            logger.info(f"[{self._name}] transcription -> LLM: \"{frame.text}\"")
-            self._llm_start = time.monotonic()
-
-        elif isinstance(frame, LLMFullResponseStartFrame):
-            ttfb = (time.monotonic() - self._llm_start) * 1000 if self._llm_start else 0
-            logger.info(f"[{self._name}] LLM first token: {ttfb:.0f}ms")
-
-        elif isinstance(frame, LLMFullResponseEndFrame):
-            elapsed = (time.monotonic() - self._llm_start) * 1000 if self._llm_start else 0
-            logger.info(f"[{self._name}] LLM done: {elapsed:.0f}ms total")
+        # Push times (pipeline clock, ns) from FramePushed; observers run from
+        # their own queue, so the time a handler runs includes that lag
+        self._llm_start = 0
+        self._tts_start = 0
+        # Exact-type dispatch to (source stage, handler); observers see every
+        # hop, so only the push out of the stage that emits a frame counts
+        self._handlers = {
+            TranscriptionFrame: (stt, self._on_transcription),
+            LLMFullResponseStartFrame: (llm, self._on_llm_start),
+            LLMFullResponseEndFrame: (llm, self._on_llm_end),
+            TTSStartedFrame: (tts, self._on_tts_start),
+            TTSStoppedFrame: (tts, self._on_tts_stop),
+        }
+
+    async def on_push_frame(self, data: FramePushed):
+        entry = self._handlers.get(type(data.frame))
+        if entry and data.source is entry[0] and data.direction == FrameDirection.DOWNSTREAM:
+            entry[1](data)
+
+    def _on_transcription(self, data: FramePushed):
+        logger.info(f"[{self._name}] transcription -> LLM: \"{data.frame.text}\"")
+        self._llm_start = data.timestamp
+
+    def _on_llm_start(self, data: FramePushed):
+        ttfb = (data.timestamp - self._llm_start) / 1e6 if self._llm_start else 0
+        logger.info(f"[{self._name}] LLM first token: {ttfb:.0f}ms")
+
+    def _on_llm_end(self, data: FramePushed):
+        elapsed = (data.timestamp - self._llm_start) / 1e6 if self._llm_start else 0
+        logger.info(f"[{self._name}] LLM done: {elapsed:.0f}ms total")
+
+    def _on_tts_start(self, data: FramePushed):
+        self._tts_start = data.timestamp
+        logger.info(f"[{self._name}] TTS started")
+
+    def _on_tts_stop(self, data: FramePushed):
+        elapsed = (data.timestamp - self._tts_start) / 1e6 if self._tts_start else 0
+        logger.info(f"[{self._name}] TTS done: {elapsed:.0f}ms")
+
+
+def _create_tts() -> FrameProcessor:
+    """Build the configured TTS (loads, and on first run downloads, its model)."""
+    if config.TTS_ENGINE == "piper":
+        # piper-tts is installed separately (uv pip install piper-tts)
+        from tts_piper import PiperTTSProcessor
+        return PiperTTSProcessor(model_path=config.PIPER_MODEL)
+    return KokoroTTSService(voice_id=config.KOKORO_VOICE)
+
+
+def _take_vad_analyzer() -> SileroVADAnalyzer:
+    """Hand out the preloaded VAD once, then build fresh ones per pipeline."""
+    global _preloaded_vad
+    vad, _preloaded_vad = _preloaded_vad, None
+    return vad or SileroVADAnalyzer()
 
-        elif isinstance(frame, TTSStartedFrame):
-            self._tts_start = time.monotonic()
-            logger.info(f"[{self._name}] TTS started")
-
-        elif isinstance(frame, TTSStoppedFrame):
-            elapsed = (time.monotonic() - self._tts_start) * 1000 if self._tts_start else 0
-            logger.info(f"[{self._name}] TTS done: {elapsed:.0f}ms")
-
-        await self.push_frame(frame, direction)
 
 # ── System Prompt ──────────────────────────────────────────────
 SYSTEM_PROMPT = """You are Buddy, a warm and witty voice companion. You speak out loud to Elie.
@@ -121,38 +158,43 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
         server_url=config.WHISPER_SERVER_URL,
     )
 
+    # Whisper warmup (network) overlaps the TTS model load (disk/CPU)
+    _, tts = await asyncio.gather(stt.warmup(), asyncio.to_thread(_create_tts))
+
     llm = AnthropicLLMService(
         api_key=config.ANTHROPIC_API_KEY,
         model=config.LLM_MODEL,
-    )
-
-    tts = KokoroTTSService(
-        voice_id=config.KOKORO_VOICE,
+        # Also marks the latest user turns, so the growing history is cached
+        params=AnthropicLLMService.InputParams(enable_prompt_caching=True),
     )
 
     # ── Conversation Context ───────────────────────────────────
+    # The system prompt is the stable cache prefix; later system messages
+    # (e.g. the greeting) come after it and carry no cache_control.
     context = LLMContext(
-        messages=[{"role": "system", "content": SYSTEM_PROMPT}],
+        messages=[{
+            "role": "system",
+            "content": [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}],
+        }],
     )
 
     context_aggregator = LLMContextAggregatorPair(
         context,
         user_params=LLMUserAggregatorParams(
-            vad_analyzer=SileroVADAnalyzer(),
+            vad_analyzer=_take_vad_analyzer(),
         ),
     )
 
     # ── Pipeline ───────────────────────────────────────────────
     # Data flows left-to-right:
-    #   audio in → STT → context → LLM → TTS → [log] → audio out → assistant context
-    pipeline_log = PipelineLogger("pipeline")
+    #   audio in → STT → context → [window] → LLM → TTS → audio out → assistant context
     pipeline = Pipeline([
         transport.input(),
         stt,
         context_aggregator.user(),
+        ContextWindow(),
         llm,
         tts,
-        pipeline_log,
         transport.output(),
         context_aggregator.assistant(),
     ])
@@ -163,6 +205,7 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
             enable_metrics=True,
             enable_usage_metrics=True,
         ),
+        observers=[PipelineLogger("pipeline", stt=stt, llm=llm, tts=tts)],
     )
 
     # ── Events ─────────────────────────────────────────────────
@@ -184,7 +227,10 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
     runner = PipelineRunner(handle_sigint=runner_args.handle_sigint)
     logger.info(f"Buddy is ready! Open http://{config.SERVER_HOST}:{config.SERVER_PORT}/client")
     logger.info(f"  STT: whisper.cpp @ {config.WHISPER_SERVER_URL}")
-    logger.info(f"  TTS: Kokoro (voice={config.KOKORO_VOICE})")
+    if config.TTS_ENGINE == "piper":
+        logger.info(f"  TTS: Piper ({config.PIPER_MODEL})")
+    else:
+        logger.info(f"  TTS: Kokoro (voice={config.KOKORO_VOICE})")
     logger.info(f"  LLM: Claude ({config.LLM_MODEL})")
     await runner.run(task)
 
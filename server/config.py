@@ -11,14 +11,19 @@ _server_dir = Path(__file__).parent
 load_dotenv(_server_dir / ".env", override=True)
 
 
+def _exit(problem: str, hint: str):
+    """Exit with a helpful message about a bad setting."""
+    print(f"\n❌  {problem}")
+    print(f"    → {hint}")
+    print(f"    Set it in: {_server_dir / '.env'}\n")
+    sys.exit(1)
+
+
 def _require_key(name: str, hint: str) -> str:
     """Get a required environment variable or exit with a helpful message."""
     value = os.getenv(name, "").strip()
     if not value or value.startswith("your_"):
-        print(f"\n❌  Missing required key: {name}")
-        print(f"    → {hint}")
-        print(f"    Set it in: {_server_dir / '.env'}\n")
-        sys.exit(1)
+        _exit(f"Missing required key: {name}", hint)
     return value
 
 
@@ -32,12 +37,23 @@ LLM_MODEL = os.getenv("BUDDY_LLM_MODEL", "claude-sonnet-4-5-20250929")
 # ── STT: Whisper.cpp (local) ──────────────────────────────
 WHISPER_SERVER_URL = os.getenv("WHISPER_SERVER_URL", "http://127.0.0.1:8178")
 
+# ── TTS engine: "kokoro" (default) or "piper" ───────────
+TTS_ENGINE = os.getenv("BUDDY_TTS", "kokoro").strip().lower()
+if TTS_ENGINE not in ("kokoro", "piper"):
+    _exit(f"Unknown BUDDY_TTS: {TTS_ENGINE}", "Use \"kokoro\" or \"piper\"")
+
 # ── TTS: Kokoro (local, ONNX — auto-downloads ~100MB on first run) ─
 KOKORO_VOICE = os.getenv("KOKORO_VOICE", "af_bella")
 
 # ── TTS: Piper (local fallback) ──────────────────────────
 _home = Path.home()
 PIPER_MODEL = os.getenv("PIPER_MODEL", str(_home / ".local/share/piper/voices/en_US-amy-medium.onnx"))
+# Prefer the int8 model from scripts/quantize_piper.py when it exists
+PIPER_MODEL_INT8 = os.getenv("PIPER_MODEL_INT8", str(Path(PIPER_MODEL).with_suffix(".int8.onnx")))
+if Path(PIPER_MODEL_INT8).is_file():
+    PIPER_MODEL = PIPER_MODEL_INT8
+if TTS_ENGINE == "piper" and not Path(PIPER_MODEL).is_file():
+    _exit(f"Piper model not found: {PIPER_MODEL}", "Run scripts/install-piper.sh or set PIPER_MODEL")
 
 # ── Server ───────────────────────────────────────────────
 SERVER_HOST = os.getenv("BUDDY_HOST", "0.0.0.0")
@@ -0,0 +1,143 @@
+"""Conversation memory for Buddy.
+
+Keeps the prompt size roughly constant over a long session: only the most
+recent turns are sent to the LLM verbatim. Older turns move into a small
+in-process store, and the ones relevant to the new user turn are recalled
+into the request.
+"""
+
+import math
+import re
+from collections import Counter
+
+from loguru import logger
+
+from pipecat.frames.frames import LLMContextFrame
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "the and for are but not you your yours with this that what when where which who why how "
+    "was were been have has had does did can could would should will just about from into "
+    "they them their there then than its it's i'm you're that's don't yeah okay well so".split()
+)
+
+
+def _keywords(text: str) -> set[str]:
+    return {w for w in _WORD.findall(text.lower()) if len(w) > 2 and w not in _STOPWORDS}
+
+
+def _text(message) -> str:
+    """Plain text of a context message (string or list of content blocks)."""
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+class TurnStore:
+    """Keyword-indexed store of conversation turns evicted from the prompt."""
+
+    def __init__(self, max_turns: int = 500):
+        self._max_turns = max_turns
+        self._turns: list[tuple[str, set[str]]] = []
+        self._doc_freq: Counter[str] = Counter()
+
+    def add(self, text: str):
+        keywords = _keywords(text)
+        self._turns.append((text, keywords))
+        self._doc_freq.update(keywords)
+        if len(self._turns) > self._max_turns:
+            _, dropped = self._turns.pop(0)
+            self._doc_freq.subtract(dropped)
+
+    def search(self, query: str, k: int = 5) -> list[str]:
+        """Return up to `k` stored turns sharing the rarest keywords with `query`."""
+        terms = _keywords(query)
+        if not terms or not self._turns:
+            return []
+
+        n = len(self._turns)
+        scored = []
+        for i, (text, keywords) in enumerate(self._turns):
+            shared = terms & keywords
+            if shared:
+                score = sum(math.log(1 + n / self._doc_freq[w]) for w in shared)
+                scored.append((score, i, text))
+
+        # Best matches first; ties go to the more recent turn
+        scored.sort(reverse=True)
+        return [text for _, _, text in scored[:k]]
+
+
+class ContextWindow(FrameProcessor):
+    """Bounds the LLM context to recent turns and recalls relevant older ones.
+
+    Sits between the user context aggregator and the LLM. The shared context
+    keeps the leading system prompt plus the last `keep_turns` user turns
+    (and their replies). Older turns are evicted into a TurnStore in batches
+    of `evict_batch`, so the cached prompt prefix stays stable between trims.
+    Recalled turns go to the LLM only, as a system message just before the
+    latest user turn, and are never written back to the shared context.
+    """
+
+    def __init__(self, keep_turns: int = 6, evict_batch: int = 6, recall_k: int = 5):
+        super().__init__()
+        self._keep_turns = keep_turns
+        self._evict_batch = evict_batch
+        self._recall_k = recall_k
+        self._store = TurnStore()
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, LLMContextFrame) and direction == FrameDirection.DOWNSTREAM:
+            self._trim(frame.context)
+            frame = self._with_recall(frame)
+
+        await self.push_frame(frame, direction)
+
+    def _trim(self, context: LLMContext):
+        messages = context.get_messages()
+        head = 1 if messages and messages[0].get("role") == "system" else 0
+        users = [i for i, m in enumerate(messages) if i >= head and m.get("role") == "user"]
+        if len(users) <= self._keep_turns + self._evict_batch:
+            return
+
+        cut = users[-self._keep_turns]
+        turn: list[str] = []
+        for message in messages[head:cut]:
+            role = message.get("role")
+            if role == "user" and turn:
+                self._store.add("\n".join(turn))
+                turn = []
+            if role in ("user", "assistant"):
+                speaker = "User" if role == "user" else "Buddy"
+                turn.append(f"{speaker}: {_text(message)}")
+        if turn:
+            self._store.add("\n".join(turn))
+
+        context.set_messages(messages[:head] + messages[cut:])
+        logger.info(f"Memory: moved {len(users) - self._keep_turns} turns out of the prompt")
+
+    def _with_recall(self, frame: LLMContextFrame) -> LLMContextFrame:
+        messages = frame.context.get_messages()
+        if not messages or messages[-1].get("role") != "user":
+            return frame
+
+        recalled = self._store.search(_text(messages[-1]), k=self._recall_k)
+        if not recalled:
+            return frame
+
+        logger.debug("Memory: recalled {} turns", len(recalled))
+        memories = {
+            "role": "system",
+            "content": "Relevant earlier conversation:\n\n" + "\n\n".join(recalled),
+        }
+        context = LLMContext(
+            messages=messages[:-1] + [memories, messages[-1]],
+            tools=frame.context.tools,
+            tool_choice=frame.context.tool_choice,
+        )
+        return LLMContextFrame(context=context)
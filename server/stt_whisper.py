@@ -1,14 +1,16 @@
 """Whisper.cpp STT integration for Pipecat.
 
-Batch transcription: buffers audio during speech, sends to whisper.cpp
-HTTP server on speech end, returns transcription.
+Streaming transcription: while the user speaks, the audio window is
+re-decoded by the whisper.cpp HTTP server every `min_chunk_seconds`.
+The longest word prefix two consecutive passes agree on is committed
+(LocalAgreement-2) and its audio is trimmed from the window, so on
+speech end only the unconfirmed tail still needs decoding.
 
 whisper.cpp server runs locally at http://127.0.0.1:8178.
 """
 
 import asyncio
-import io
-import struct
+import secrets
 import time
 
 import aiohttp
@@ -16,6 +18,7 @@ from loguru import logger
 
 from pipecat.frames.frames import (
     AudioRawFrame,
+    CancelFrame,
     EndFrame,
     TranscriptionFrame,
     UserStartedSpeakingFrame,
@@ -24,8 +27,52 @@ from pipecat.frames.frames import (
 from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 
 
+_WAV_HEADER_SIZE = 44
+_UNRESOLVED = object()  # handler cache miss (None means "just forward")
+
+
+class _Utterance:
+    """Audio window and LocalAgreement state for one user utterance."""
+
+    def __init__(self, wav_header: bytes, capacity: int):
+        # Unconfirmed PCM, oldest sample first, preallocated so appends never
+        # reallocate. The WAV header lives in place at the front so an upload
+        # is a single snapshot copy.
+        self.window = bytearray(_WAV_HEADER_SIZE + capacity)
+        self.window[:_WAV_HEADER_SIZE] = wav_header
+        self.pcm_size = 0
+        self.captured = 0  # all PCM bytes seen, including trimmed audio
+        self.sent = 0  # window length when the last partial decode was started
+        self.covered = 0  # window length the last completed partial decoded
+        self.confirmed: list[str] = []  # committed words
+        self.hypothesis: list[str] = []  # uncommitted words from the last pass
+        self.task: asyncio.Task | None = None  # in-flight partial decode
+        self.start = time.monotonic()
+
+    def append(self, pcm: bytes | bytearray):
+        end = _WAV_HEADER_SIZE + self.pcm_size
+        # Writes in place; only grows the buffer if capacity is exceeded
+        self.window[end:end + len(pcm)] = pcm
+        self.pcm_size += len(pcm)
+        self.captured += len(pcm)
+
+    def trim(self, size: int):
+        """Drop `size` bytes of confirmed PCM from the front of the window."""
+        start, end = _WAV_HEADER_SIZE, _WAV_HEADER_SIZE + self.pcm_size
+        self.window[start:end - size] = self.window[start + size:end]
+        self.pcm_size -= size
+
+    def wav_body(self, prefix: bytes, suffix: bytes) -> bytes:
+        """Snapshot the window as a WAV file between `prefix` and `suffix`."""
+        size = self.pcm_size
+        self.window[4:8] = (36 + size).to_bytes(4, "little")
+        self.window[40:44] = size.to_bytes(4, "little")
+        with memoryview(self.window) as view:
+            return b"".join((prefix, view[:_WAV_HEADER_SIZE + size], suffix))
+
+
 class WhisperSTTProcessor(FrameProcessor):
-    """Buffers audio during speech, transcribes via whisper.cpp on speech end."""
+    """Transcribes speech incrementally via whisper.cpp, emits text on speech end."""
 
     def __init__(
         self,
@@ -33,6 +80,9 @@ class WhisperSTTProcessor(FrameProcessor):
         language: str = "en",
         sample_rate: int = 16000,
         timeout_seconds: float = 10.0,
+        min_chunk_seconds: float = 1.0,
+        max_window_seconds: float = 15.0,
+        min_speech_ms: int = 300,
     ):
         super().__init__()
         self._server_url = server_url.rstrip("/")
@@ -41,86 +91,243 @@ class WhisperSTTProcessor(FrameProcessor):
         self._timeout = aiohttp.ClientTimeout(total=timeout_seconds)
         self._session: aiohttp.ClientSession | None = None
 
-        # Audio buffering
-        self._is_speaking = False
-        self._audio_buffer: list[bytes] = []
-        self._speech_start: float = 0
+        # Streaming window (16-bit mono PCM = 2 bytes/sample)
+        self._min_chunk_bytes = int(min_chunk_seconds * sample_rate) * 2
+        self._max_window_bytes = int(max_window_seconds * sample_rate) * 2
+        self._frag_bytes = int(0.25 * sample_rate) * 2
+        self._min_speech_bytes = int(min_speech_ms * sample_rate / 1000) * 2
+        self._frag = bytearray()  # VAD frames are ~20ms; batch them per 250ms
+        self._utterance: _Utterance | None = None
+        self._final_task: asyncio.Task | None = None
+
+        # Dispatch on exact frame type; audio frames arrive at 50-100 Hz.
+        # Subclasses are resolved through the MRO once and cached here.
+        self._handlers = {
+            AudioRawFrame: self._on_audio,
+            UserStartedSpeakingFrame: self._on_speech_started,
+            UserStoppedSpeakingFrame: self._on_speech_stopped,
+            EndFrame: self._on_end,
+            CancelFrame: self._on_end,  # client disconnect
+        }
+
+        # WAV header is constant apart from the two size fields (RIFF, data),
+        # which _Utterance.wav_body() patches in place. whisper-server decodes
+        # uploads with miniaudio, so headerless PCM is rejected.
+        num_channels, bits_per_sample = 1, 16
+        block_align = num_channels * bits_per_sample // 8
+        self._wav_header = (
+            b"RIFF\x00\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00"  # PCM format
+            + num_channels.to_bytes(2, "little")
+            + sample_rate.to_bytes(4, "little")
+            + (sample_rate * block_align).to_bytes(4, "little")  # byte rate
+            + block_align.to_bytes(2, "little")
+            + bits_per_sample.to_bytes(2, "little")
+            + b"data\x00\x00\x00\x00"
+        )
+
+        # /inference request body is fixed apart from the WAV payload, so the
+        # multipart framing around it is built once
+        boundary = "----buddy" + secrets.token_hex(8)
+        self._mp_headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        self._mp_prefix = "".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in (("language", language), ("response_format", "verbose_json"))
+        ).encode() + (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="audio.wav"\r\n'
+            "Content-Type: audio/wav\r\n\r\n"
+        ).encode()
+        self._mp_suffix = f"\r\n--{boundary}--\r\n".encode()
+        self._mp_overhead = len(self._mp_prefix) + _WAV_HEADER_SIZE + len(self._mp_suffix)
 
     async def _get_session(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession(timeout=self._timeout)
+            # One long-lived keep-alive socket: whisper.cpp serves requests
+            # serially anyway, and the host is resolved only once.
+            connector = aiohttp.TCPConnector(limit=1, keepalive_timeout=300, ttl_dns_cache=None)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
         return self._session
 
+    async def warmup(self):
+        """Open the keep-alive connection and run one tiny inference.
+
+        whisper.cpp's first /inference call pays for buffer allocation and
+        thread-pool spin-up; 100ms of silence moves that off the first
+        user utterance.
+        """
+        silence_bytes = self._sample_rate * 2 // 10
+        silence = _Utterance(self._wav_header, silence_bytes)
+        silence.append(bytes(silence_bytes))
+
+        t0 = time.monotonic()
+        if await self._transcribe(self._request_body(silence), final=False) is None:
+            logger.warning("Whisper server warmup failed — first utterance may be slow")
+        else:
+            logger.info(f"Whisper server warm ({(time.monotonic() - t0) * 1000:.0f}ms)")
+
     async def process_frame(self, frame, direction):
         await super().process_frame(frame, direction)
 
-        if isinstance(frame, UserStartedSpeakingFrame):
-            self._is_speaking = True
-            self._audio_buffer = []
-            self._speech_start = time.monotonic()
-            logger.info("VAD: speech started")
-            await self.push_frame(frame, direction)
+        handler = self._handlers.get(type(frame), _UNRESOLVED)
+        if handler is _UNRESOLVED:
+            handler = self._handlers[type(frame)] = self._resolve_handler(type(frame))
 
-        elif isinstance(frame, UserStoppedSpeakingFrame):
-            self._is_speaking = False
-            speech_dur = (time.monotonic() - self._speech_start) * 1000 if self._speech_start else 0
-            logger.info(f"VAD: speech ended ({speech_dur:.0f}ms)")
+        if handler:
+            await handler(frame, direction)
+        else:
             await self.push_frame(frame, direction)
 
-            if self._audio_buffer:
-                text = await self._transcribe()
-                if text:
-                    logger.info(f"STT result: \"{text}\"")
-                    await self.push_frame(TranscriptionFrame(
-                        text=text,
-                        user_id="user",
-                        timestamp=str(time.time()),
-                    ))
-                else:
-                    logger.info("STT result: (empty)")
-                self._audio_buffer = []
-
-        elif isinstance(frame, AudioRawFrame):
-            if self._is_speaking:
-                self._audio_buffer.append(frame.audio)
-            await self.push_frame(frame, direction)
+    def _resolve_handler(self, frame_type: type):
+        """Find the handler for a frame subclass (e.g. InputAudioRawFrame)."""
+        for base in frame_type.__mro__:
+            handler = self._handlers.get(base, _UNRESOLVED)
+            if handler is not _UNRESOLVED:
+                return handler
+        return None
 
-        elif isinstance(frame, EndFrame):
-            await self._cleanup()
-            await self.push_frame(frame, direction)
+    async def _on_speech_started(self, frame, direction):
+        self._utterance = _Utterance(self._wav_header, self._max_window_bytes)
+        self._frag.clear()
+        logger.info("VAD: speech started")
+        await self.push_frame(frame, direction)
 
-        else:
-            await self.push_frame(frame, direction)
+    async def _on_speech_stopped(self, frame, direction):
+        if self._utterance:
+            self._flush_fragment(self._utterance)
+        utterance, self._utterance = self._utterance, None
+        speech_dur = (time.monotonic() - utterance.start) * 1000 if utterance else 0
+        logger.info(f"VAD: speech ended ({speech_dur:.0f}ms)")
+        await self.push_frame(frame, direction)
 
-    async def _transcribe(self) -> str | None:
-        """Send buffered audio to whisper.cpp and return transcription."""
-        if not self._audio_buffer:
-            return None
+        if utterance and utterance.captured < self._min_speech_bytes:
+            # Coughs and clicks: not worth a whisper.cpp round-trip
+            logger.info("VAD: speech too short, dropped")
+            if utterance.task:
+                await self.cancel_task(utterance.task)
+        elif utterance:
+            # Decode the tail in the background so audio frames (and the
+            # next utterance) keep flowing while whisper.cpp works.
+            self._final_task = self.create_task(
+                self._finish_and_emit(utterance, self._final_task)
+            )
+
+    async def _on_audio(self, frame, direction):
+        if self._utterance:
+            self._frag += frame.audio
+            if len(self._frag) >= self._frag_bytes:
+                self._flush_fragment(self._utterance)
+                self._maybe_decode_partial(self._utterance)
+        await self.push_frame(frame, direction)
 
+    async def _on_end(self, frame, direction):
+        await self._cleanup()
+        await self.push_frame(frame, direction)
+
+    def _flush_fragment(self, utterance: _Utterance):
+        utterance.append(self._frag)
+        self._frag.clear()
+
+    def _maybe_decode_partial(self, utterance: _Utterance):
+        """Start a partial decode if enough new audio arrived and none is in flight."""
+        if utterance.task is not None:
+            return
+        if utterance.pcm_size - utterance.sent < self._min_chunk_bytes:
+            return
+        utterance.sent = utterance.pcm_size
+        utterance.task = self.create_task(
+            self._decode_partial(utterance, self._request_body(utterance))
+        )
+
+    async def _decode_partial(self, utterance: _Utterance, body: bytes):
         try:
-            pcm_data = b"".join(self._audio_buffer)
-            audio_duration = len(pcm_data) / (self._sample_rate * 2) * 1000  # 16-bit = 2 bytes/sample
+            words = await self._transcribe(body, final=False)
+            if words is not None:
+                self._agree(utterance, words)
+                utterance.covered = utterance.sent
+        finally:
+            utterance.task = None
 
-            t_wav = time.monotonic()
-            wav_bytes = self._pcm_to_wav(pcm_data, self._sample_rate)
-            wav_ms = (time.monotonic() - t_wav) * 1000
+    def _agree(self, utterance: _Utterance, words: list[tuple[str, float]]):
+        """Commit the word prefix two consecutive passes agree on (LocalAgreement-2)."""
+        agreed = 0
+        for previous, (word, _) in zip(utterance.hypothesis, words):
+            if _normalize(previous) != _normalize(word):
+                break
+            agreed += 1
 
-            session = await self._get_session()
+        trim = 0
+        if utterance.pcm_size > self._max_window_bytes:
+            # Window too long without agreement: commit all but the newest
+            # word (it may be cut off mid-sound), and drop the oldest audio if
+            # that still leaves the window over the cap (e.g. long noise).
+            agreed = max(agreed, len(words) - 1)
+            trim = utterance.pcm_size - self._max_window_bytes
 
-            form = aiohttp.FormData()
-            form.add_field(
-                "file",
-                wav_bytes,
-                filename="audio.wav",
-                content_type="audio/wav",
+        if agreed:
+            utterance.confirmed.extend(word for word, _ in words[:agreed])
+            trim = max(trim, int(words[agreed - 1][1] * self._sample_rate) * 2)
+            logger.opt(lazy=True).debug(
+                "STT confirmed: \"{}\"", lambda: " ".join(utterance.confirmed)
             )
-            form.add_field("language", self._language)
-            form.add_field("response_format", "json")
+
+        if trim:
+            trim = min(trim, utterance.pcm_size)
+            utterance.trim(trim)
+            utterance.sent = max(0, utterance.sent - trim)
+
+        utterance.hypothesis = [word for word, _ in words[agreed:]]
+
+    async def _finish_and_emit(self, utterance: _Utterance, previous: asyncio.Task | None):
+        """Transcribe a finished utterance and push it, after any earlier one."""
+        text = await self._finish(utterance)
+        if previous is not None:
+            await previous
+
+        if text:
+            logger.info(f"STT result: \"{text}\"")
+            await self.push_frame(TranscriptionFrame(
+                text=text,
+                user_id="user",
+                timestamp=str(time.time()),
+            ))
+        else:
+            logger.info("STT result: (empty)")
+
+    async def _finish(self, utterance: _Utterance) -> str | None:
+        """Decode the unconfirmed tail and return the full utterance text."""
+        if utterance.task is not None:
+            # whisper.cpp serves one request at a time; let the partial land first
+            await utterance.task
+
+        # The last partial may already have decoded the whole window; its
+        # hypothesis is then the tail and no second decode is needed.
+        tail = utterance.hypothesis
+        if utterance.pcm_size > utterance.covered:
+            words = await self._transcribe(self._request_body(utterance), final=True)
+            if words is not None:
+                tail = [word for word, _ in words]
+
+        text = " ".join(utterance.confirmed + tail).strip()
+        return text or None
+
+    def _request_body(self, utterance: _Utterance) -> bytes:
+        return utterance.wav_body(self._mp_prefix, self._mp_suffix)
+
+    async def _transcribe(self, body: bytes, final: bool = True) -> list[tuple[str, float]] | None:
+        """Send a multipart WAV body to whisper.cpp and return (word, end_seconds) pairs."""
+        pcm_size = len(body) - self._mp_overhead
+        if pcm_size <= 0:
+            return None
+
+        try:
+            audio_duration = pcm_size / (self._sample_rate * 2) * 1000  # 16-bit = 2 bytes/sample
+
+            session = await self._get_session()
 
             t_http = time.monotonic()
             async with session.post(
                 f"{self._server_url}/inference",
-                data=form,
+                data=body,
+                headers=self._mp_headers,
             ) as resp:
                 if resp.status != 200:
                     logger.error(f"Whisper server returned {resp.status}: {await resp.text()}")
@@ -129,16 +336,16 @@ class WhisperSTTProcessor(FrameProcessor):
                 result = await resp.json()
                 http_ms = (time.monotonic() - t_http) * 1000
 
-                text = result.get("text", "").strip()
-                total_ms = wav_ms + http_ms
-                rtf = total_ms / audio_duration if audio_duration > 0 else 0
-                logger.info(
-                    f"STT profiling: audio={audio_duration:.0f}ms, "
-                    f"wav_encode={wav_ms:.1f}ms, whisper={http_ms:.0f}ms, "
-                    f"total={total_ms:.0f}ms, RTF={rtf:.2f}x"
+                words = [word for seg in result.get("segments", []) for word in _words(seg)]
+                rtf = http_ms / audio_duration if audio_duration > 0 else 0
+                # Partials log at DEBUG; format args so they cost nothing when filtered
+                logger.log(
+                    "INFO" if final else "DEBUG",
+                    "STT profiling ({}): audio={:.0f}ms, whisper={:.0f}ms, RTF={:.2f}x",
+                    "final" if final else "partial", audio_duration, http_ms, rtf,
                 )
 
-                return text or None
+                return words
 
         except asyncio.TimeoutError:
             logger.error("Whisper server timeout — is it running on 127.0.0.1:8178?")
@@ -151,30 +358,46 @@ class WhisperSTTProcessor(FrameProcessor):
             return None
 
     async def _cleanup(self):
+        if self._utterance and self._utterance.task:
+            await self.cancel_task(self._utterance.task)
+        self._utterance = None
+        if self._final_task:
+            await self.cancel_task(self._final_task)
+            self._final_task = None
         if self._session and not self._session.closed:
             await self._session.close()
 
-    @staticmethod
-    def _pcm_to_wav(pcm_data: bytes, sample_rate: int = 16000, bits_per_sample: int = 16) -> bytes:
-        """Convert raw PCM bytes to WAV format."""
-        num_channels = 1
-        byte_rate = sample_rate * num_channels * bits_per_sample // 8
-        block_align = num_channels * bits_per_sample // 8
-        data_size = len(pcm_data)
-
-        buf = io.BytesIO()
-        buf.write(b"RIFF")
-        buf.write(struct.pack("<I", 36 + data_size))
-        buf.write(b"WAVE")
-        buf.write(b"fmt ")
-        buf.write(struct.pack("<I", 16))
-        buf.write(struct.pack("<H", 1))  # PCM format
-        buf.write(struct.pack("<H", num_channels))
-        buf.write(struct.pack("<I", sample_rate))
-        buf.write(struct.pack("<I", byte_rate))
-        buf.write(struct.pack("<H", block_align))
-        buf.write(struct.pack("<H", bits_per_sample))
-        buf.write(b"data")
-        buf.write(struct.pack("<I", data_size))
-        buf.write(pcm_data)
-        return buf.getvalue()
+
+def _normalize(text: str) -> str:
+    """Compare hypotheses on words only, ignoring case and punctuation."""
+    return " ".join("".join(c for c in text.lower() if c.isalnum() or c.isspace()).split())
+
+
+def _words(segment: dict) -> list[tuple[str, float]]:
+    """Split a verbose_json segment into (word, end_seconds) pairs.
+
+    whisper.cpp reports per-token timings under "words"; tokens that don't
+    start with a space continue the previous word. Without them, end times
+    are spread over the segment in proportion to word length.
+    """
+    tokens = segment.get("words") or []
+    if tokens and all("end" in token for token in tokens):
+        words: list[tuple[str, float]] = []
+        for token in tokens:
+            text = token.get("word", "")
+            if text.startswith("[_"):  # special tokens, e.g. [_BEG_]
+                continue
+            if words and not text.startswith(" "):
+                words[-1] = (words[-1][0] + text, float(token["end"]))
+            else:
+                words.append((text.strip(), float(token["end"])))
+        return [(word, end) for word, end in words if word]
+
+    texts = segment.get("text", "").split()
+    start, end = float(segment.get("start", 0)), float(segment.get("end", 0))
+    total = sum(len(text) for text in texts) or 1
+    words, done = [], 0
+    for text in texts:
+        done += len(text)
+        words.append((text, start + (end - start) * done / total))
+    return words
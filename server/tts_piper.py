@@ -2,82 +2,351 @@
 
 Generates speech locally using the piper-tts Python package.
 ~100ms for short sentences. Zero cost, fully private.
+
+LLM text is split into sentences, which are queued and synthesized by a
+single consumer task, so the first sentence plays while the LLM is still
+producing the rest. Synthesized audio is cached by text in memory, so
+recurring short phrases skip ONNX inference. Phrases that recur are also
+persisted under ~/.cache/buddy/tts/ (at most `cache_size` files).
 """
 
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import onnxruntime
 from loguru import logger
 from piper import PiperVoice
+from piper.config import PiperConfig
 
 from pipecat.frames.frames import (
+    AggregationType,
+    CancelFrame,
     EndFrame,
+    Frame,
+    InterruptionFrame,
+    LLMFullResponseEndFrame,
+    SystemFrame,
     TTSAudioRawFrame,
     TextFrame,
     TTSStartedFrame,
     TTSStoppedFrame,
+    TTSTextFrame,
+    UninterruptibleFrame,
 )
-from pipecat.processors.frame_processor import FrameProcessor
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+# Sentence-terminal punctuation followed by whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
 
 
 class PiperTTSProcessor(FrameProcessor):
     """Converts text to speech using Piper TTS (Python library).
 
     Receives TextFrames from the LLM, generates audio via PiperVoice,
-    and emits AudioRawFrames for the transport to play.
+    and emits AudioRawFrames for the transport to play, followed by a
+    TTSTextFrame per sentence for the assistant context.
+
+    Downstream frames go through one queue (sentences as str, other frames
+    as-is) so audio and control frames leave in the order they arrived.
+    System frames bypass the queue.
     """
 
-    def __init__(self, model_path: str):
+    def __init__(
+        self,
+        model_path: str,
+        cache_dir: str | None = str(Path.home() / ".cache/buddy/tts"),
+        cache_size: int = 256,
+        cache_max_chars: int = 80,
+    ):
         super().__init__()
         if not Path(model_path).is_file():
             raise FileNotFoundError(f"Piper model not found: {model_path}")
 
-        self._voice = PiperVoice.load(model_path)
+        self._voice = self._load_voice(model_path)
+        # ONNX inference blocks, so it runs off the event loop on one worker
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="piper")
+        self._voice_id = Path(model_path).stem
         self._sample_rate = self._voice.config.sample_rate
-        logger.info(f"Piper TTS ready: {Path(model_path).stem} ({self._sample_rate}Hz)")
+
+        # Synthesis cache for short, recurring phrases (greetings, "Hmm,", "Yeah,"):
+        # LRU in memory; a phrase goes to disk only once it is heard a second
+        # time, so one-off replies never leave the process (cache_dir=None
+        # disables disk). Both tiers hold at most cache_size entries.
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_max_chars = cache_max_chars
+        self._cache_dir = Path(cache_dir) if cache_dir else None
+        self._disk: OrderedDict[str, None] = OrderedDict()  # keys on disk, oldest first
+        if self._cache_dir:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            files = sorted(self._cache_dir.glob("*.pcm"), key=lambda f: f.stat().st_mtime)
+            self._disk = OrderedDict.fromkeys(f.stem for f in files)
+            self._disk_delete(self._disk_evict())
+
+        # Sentence pipeline
+        self._text = ""
+        self._queue: asyncio.Queue[str | Frame] = asyncio.Queue()
+        self._consumer_task: asyncio.Task | None = None
+        self._speaking = False
+
+        precision = next((p for p in ("int8", "fp16") if f".{p}." in Path(model_path).name), "fp32")
+        logger.info(f"Piper TTS ready: {self._voice_id} ({self._sample_rate}Hz, {precision})")
 
     async def process_frame(self, frame, direction):
         await super().process_frame(frame, direction)
 
         if isinstance(frame, TextFrame):
-            text = frame.text.strip()
-            if text:
-                await self._synthesize_and_emit(text)
+            self._text += frame.text
+            *sentences, self._text = _SENTENCE_END.split(self._text)
+            for sentence in sentences:
+                self._enqueue(sentence)
 
-        elif isinstance(frame, EndFrame):
+        elif isinstance(frame, InterruptionFrame):
+            await self._stop_consumer()
+            self._text = ""
             await self.push_frame(frame, direction)
+            # After the interruption, so downstream queue resets don't drop it
+            if self._speaking:
+                self._speaking = False
+                await self.push_frame(TTSStoppedFrame())
+            self._reset_queue()
 
-        else:
+        elif isinstance(frame, CancelFrame):
+            await self._stop_consumer()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            await self.push_frame(frame, direction)
+
+        elif isinstance(frame, SystemFrame) or direction == FrameDirection.UPSTREAM:
             await self.push_frame(frame, direction)
 
+        else:
+            if isinstance(frame, (LLMFullResponseEndFrame, EndFrame)):
+                self._enqueue(self._text)
+                self._text = ""
+            self._enqueue(frame)
+
+    def _enqueue(self, item: str | Frame):
+        if isinstance(item, str):
+            item = item.strip()
+            if not item:
+                return
+        self._queue.put_nowait(item)
+        if self._consumer_task is None:
+            self._consumer_task = self.create_task(self._consume())
+
+    def _reset_queue(self):
+        """Drop queued sentences, keeping frames that must survive interruption (EndFrame)."""
+        queue, self._queue = self._queue, asyncio.Queue()
+        while not queue.empty():
+            item = queue.get_nowait()
+            if isinstance(item, UninterruptibleFrame):
+                self._enqueue(item)
+
+    async def _stop_consumer(self):
+        if self._consumer_task:
+            await self.cancel_task(self._consumer_task)
+            self._consumer_task = None
+
+    async def _consume(self):
+        """Synthesize queued sentences in order, passing other frames through."""
+        while True:
+            item = await self._queue.get()
+
+            if isinstance(item, str):
+                if not self._speaking:
+                    self._speaking = True
+                    await self.push_frame(TTSStartedFrame())
+                await self._synthesize_and_emit(item)
+                # The assistant context aggregator builds the reply from these,
+                # so an interrupted reply only records what was actually spoken
+                await self.push_frame(TTSTextFrame(item, aggregated_by=AggregationType.SENTENCE))
+                continue
+
+            if isinstance(item, (LLMFullResponseEndFrame, EndFrame)) and self._speaking:
+                self._speaking = False
+                await self.push_frame(TTSStoppedFrame())
+
+            await self.push_frame(item)
+
+            if isinstance(item, EndFrame):
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._consumer_task = None
+                return
+
     async def _synthesize_and_emit(self, text: str):
-        """Generate speech from text and emit as audio frames."""
+        """Generate speech from text and emit audio frames as chunks are ready."""
         try:
             t0 = time.monotonic()
 
-            await self.push_frame(TTSStartedFrame())
+            key = None
+            pcm_data = None
+            if len(text) <= self._cache_max_chars:
+                key = hashlib.blake2b((self._voice_id + text).encode(), digest_size=16).hexdigest()
+                pcm_data = await self._cache_get(key)
 
-            # Synthesize all chunks and combine
-            pcm_parts = []
-            for chunk in self._voice.synthesize(text):
-                pcm_parts.append(chunk.audio_int16_bytes)
+            if pcm_data is not None:
+                await self._emit_audio(pcm_data)
+                emitted = len(pcm_data)
+            else:
+                # Push each Piper chunk (one per sentence) as soon as it is ready,
+                # holding back anything shorter than 20ms to avoid playout underruns
+                min_bytes = self._sample_rate * 2 // 50
+                cached_parts = [] if key else None
+                pending = bytearray()
+                emitted = 0
+                async for audio in self._synthesize_chunks(text):
+                    if cached_parts is not None:
+                        cached_parts.append(audio)
+                    pending += audio
+                    if len(pending) >= min_bytes:
+                        if not emitted:
+                            logger.opt(lazy=True).debug(
+                                "Piper TTS: first audio after {:.0f}ms",
+                                lambda: (time.monotonic() - t0) * 1000,
+                            )
+                        await self._emit_audio(bytes(pending))
+                        emitted += len(pending)
+                        pending.clear()
 
-            pcm_data = b"".join(pcm_parts)
+                if pending:
+                    await self._emit_audio(bytes(pending))
+                    emitted += len(pending)
+                if emitted and cached_parts is not None:
+                    self._remember(key, b"".join(cached_parts))
 
-            if not pcm_data:
+            if not emitted:
                 logger.error("Piper produced empty audio")
                 return
 
-            elapsed = (time.monotonic() - t0) * 1000
-            logger.debug(f"Piper TTS: {elapsed:.0f}ms for: {text[:60]}...")
-
-            await self.push_frame(TTSAudioRawFrame(
-                audio=pcm_data,
-                sample_rate=self._sample_rate,
-                num_channels=1,
-            ))
-
-            await self.push_frame(TTSStoppedFrame())
+            logger.opt(lazy=True).debug(
+                "Piper TTS: {:.0f}ms for: {}...",
+                lambda: (time.monotonic() - t0) * 1000,
+                lambda: text[:60],
+            )
 
         except Exception as e:
             logger.error(f"Piper TTS error: {e}")
+
+    async def _synthesize_chunks(self, text: str):
+        """Run Piper in the worker thread, yielding PCM chunks as they arrive."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+        stop = threading.Event()
+
+        def worker():
+            try:
+                for chunk in self._voice.synthesize(text):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.audio_int16_bytes)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        future = loop.run_in_executor(self._pool, worker)
+        try:
+            while (audio := await queue.get()) is not None:
+                yield audio
+            await future  # re-raise errors from the worker
+        finally:
+            stop.set()
+
+    async def _emit_audio(self, pcm_data: bytes):
+        await self.push_frame(TTSAudioRawFrame(
+            audio=pcm_data,
+            sample_rate=self._sample_rate,
+            num_channels=1,
+        ))
+
+    @staticmethod
+    def _load_voice(model_path: str) -> PiperVoice:
+        """Load a Piper voice with a tuned ONNX Runtime session."""
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+
+        with open(f"{model_path}.json", encoding="utf-8") as f:
+            config = PiperConfig.from_dict(json.load(f))
+
+        return PiperVoice(
+            session=onnxruntime.InferenceSession(
+                model_path,
+                sess_options=options,
+                providers=["CPUExecutionProvider"],
+            ),
+            config=config,
+        )
+
+    async def _cache_get(self, key: str) -> bytes | None:
+        loop = asyncio.get_running_loop()
+        pcm_data = self._cache.get(key)
+        if pcm_data is not None:
+            self._cache.move_to_end(key)
+            if self._cache_dir and key not in self._disk:
+                # Heard twice: worth keeping across restarts. Not awaited so
+                # playback doesn't wait on the write; the single worker still
+                # orders it before any later read of this key.
+                self._disk[key] = None
+                evicted = self._disk_evict()
+                loop.run_in_executor(self._pool, self._disk_write, key, pcm_data, evicted)
+            return pcm_data
+
+        if key not in self._disk:
+            return None
+        self._disk.move_to_end(key)
+        pcm_data = await loop.run_in_executor(self._pool, self._disk_read, key)
+        if pcm_data is None:
+            self._disk.pop(key, None)
+        else:
+            self._remember(key, pcm_data)
+        return pcm_data
+
+    def _remember(self, key: str, pcm_data: bytes):
+        self._cache[key] = pcm_data
+        self._cache.move_to_end(key)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _disk_evict(self) -> list[str]:
+        """Drop the oldest keys past cache_size from the disk index and return them."""
+        evicted = []
+        while len(self._disk) > self._cache_size:
+            evicted.append(self._disk.popitem(last=False)[0])
+        return evicted
+
+    # Disk I/O below runs on the Piper worker thread, never on the event loop
+
+    def _disk_read(self, key: str) -> bytes | None:
+        path = self._cache_dir / f"{key}.pcm"
+        try:
+            pcm_data = path.read_bytes()
+            os.utime(path)  # keeps eviction order least-recently-used across restarts
+        except OSError:
+            return None
+        return pcm_data
+
+    def _disk_write(self, key: str, pcm_data: bytes, evicted: list[str]):
+        self._disk_delete(evicted)
+        try:
+            # Write to a temp file and rename so readers never see partial audio
+            fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(pcm_data)
+            os.replace(tmp_path, self._cache_dir / f"{key}.pcm")
+        except OSError as e:
+            logger.warning(f"Piper TTS cache write failed: {e}")
+
+    def _disk_delete(self, keys: list[str]):
+        for key in keys:
+            try:
+                (self._cache_dir / f"{key}.pcm").unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Piper TTS cache eviction failed: {e}")